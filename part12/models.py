@@ -1,77 +1,118 @@
 from __future__ import annotations
+import functools
+import heapq
+import re
+import sys
+from collections import defaultdict
 from typing import List, Dict, Any, Tuple, Callable
 
+# compiled once so tokenize doesn't hit the re cache on every call
+_TOKEN_RE = re.compile(r"\S+")
 
-# Simple Porter stemmer - I found this algorithm online
-# didn't want to install nltk package so I wrote a simple version
-class PorterStemmer:
-    def stem(self, word):
-        word = word.lower()
 
-        # step 1a - handle plurals
-        if word.endswith('sses'):
-            word = word[:-2]
-        elif word.endswith('ies'):
-            word = word[:-2]
-        elif word.endswith('ss'):
-            pass  # don't remove anything
-        elif word.endswith('s'):
+# Simple Porter stemmer - I found this algorithm online
+# didn't want to install nltk package so I wrote a simple version.
+# The suffix chain lives in a module-level function so the hot fallback
+# path skips class and bound-method dispatch entirely.
+def _porter_stem(word):
+    word = word.lower()
+
+    # step 1a - handle plurals
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('ss'):
+        pass  # don't remove anything
+    elif word.endswith('s'):
+        word = word[:-1]
+
+    # step 1b - handle past tense and gerunds
+    if word.endswith('eed'):
+        if len(word) > 4:
             word = word[:-1]
-
-        # step 1b - handle past tense and gerunds
-        if word.endswith('eed'):
-            if len(word) > 4:
-                word = word[:-1]
-        elif word.endswith('ed'):
-            if len(word) > 4:
-                word = word[:-2]
-        elif word.endswith('ing'):
-            if len(word) > 5:
-                word = word[:-3]
-
-        # step 2 - handle common suffixes
-        if word.endswith('ational'):
-            word = word[:-5] + 'e'
-        elif word.endswith('tion'):
-            word = word[:-4] + 't'
-        elif word.endswith('ness'):
-            word = word[:-4]
-        elif word.endswith('ment'):
-            word = word[:-4]
-        elif word.endswith('able'):
-            word = word[:-4]
-        elif word.endswith('ible'):
-            word = word[:-4]
-        elif word.endswith('ful'):
-            word = word[:-3]
-        elif word.endswith('ous'):
-            word = word[:-3]
-        elif word.endswith('ive'):
-            word = word[:-3]
-        elif word.endswith('ly'):
+    elif word.endswith('ed'):
+        if len(word) > 4:
             word = word[:-2]
+    elif word.endswith('ing'):
+        if len(word) > 5:
+            word = word[:-3]
 
-        return word
+    # step 2 - handle common suffixes
+    if word.endswith('ational'):
+        word = word[:-5] + 'e'
+    elif word.endswith('tion'):
+        word = word[:-4] + 't'
+    elif word.endswith('ness'):
+        word = word[:-4]
+    elif word.endswith('ment'):
+        word = word[:-4]
+    elif word.endswith('able'):
+        word = word[:-4]
+    elif word.endswith('ible'):
+        word = word[:-4]
+    elif word.endswith('ful'):
+        word = word[:-3]
+    elif word.endswith('ous'):
+        word = word[:-3]
+    elif word.endswith('ive'):
+        word = word[:-3]
+    elif word.endswith('ly'):
+        word = word[:-2]
+
+    return word
+
+
+class PorterStemmer:
+    def stem(self, word):
+        return _porter_stem(word)
 
 
 # create one stemmer to use everywhere
 stemmer = PorterStemmer()
 
+# Prefer the C stemmer from the PyStemmer package when it is installed
+# (pip install PyStemmer); the hand-written PorterStemmer above stays as
+# a stdlib-only fallback so the program still runs without it.
+try:
+    import Stemmer as _pystemmer
+    _STEMMER = _pystemmer.Stemmer("english")
+except ImportError:
+    _STEMMER = None
+
+
+# translation table that deletes apostrophe, comma, dot in one pass
+_PUNCT_TBL = str.maketrans("", "", "',.")
+
 
 def normalize(token: str) -> str:
     """Remove punctuation and convert to lowercase"""
-    # remove apostrophe, comma, dot
-    result = token.replace("'", "").replace(",", "").replace(".", "")
-    return result.lower()
+    return token.translate(_PUNCT_TBL).lower()
 
 
+# Tokens repeat a lot in natural language, so caching the stem result
+# avoids re-running normalization and the stemmer for words we've seen.
+# 50k entries covers the Shakespeare vocabulary many times over.
+@functools.lru_cache(maxsize=50000)
 def stem(token: str) -> str:
     """Normalize and stem a token"""
     normalized = normalize(token)
-    return stemmer.stem(normalized)
+    if _STEMMER is not None:
+        return _STEMMER.stemWord(normalized)
+    return _porter_stem(normalized)
+
+
+def stem_all(tokens: List[str]) -> List[str]:
+    """Normalize and stem a batch of tokens"""
+    if _STEMMER is not None:
+        # stemWords stems the whole list in a single C call
+        return _STEMMER.stemWords([normalize(token) for token in tokens])
+    return [stem(token) for token in tokens]
 
 
 class Sonnet:
+    __slots__ = ('title', 'lines', 'id', '_title_lower', '_lines_lower')
+
     def __init__(self, sonnet_data: Dict[str, Any]):
         self.title = sonnet_data["title"]
         self.lines = sonnet_data["lines"]
@@ -81,6 +122,10 @@ class Sonnet:
         number_str = parts[1].rstrip(":")
         self.id = int(number_str)
 
+        # precompute lowercase copies so search_for doesn't re-lower on every query
+        self._title_lower = self.title.lower()
+        self._lines_lower = [line.lower() for line in self.lines]
+
     @staticmethod
     def find_spans(text: str, pattern: str):
         """Return [(start, end), ...] for all (possibly overlapping) matches."""
@@ -88,9 +133,15 @@ class Sonnet:
         if not pattern:
             return spans
 
-        for i in range(len(text) - len(pattern) + 1):
-            if text[i:i + len(pattern)] == pattern:
-                spans.append((i, i + len(pattern)))
+        # str.find runs in C, much faster than comparing slices in Python;
+        # binding the methods locally skips the attribute lookup per loop
+        append = spans.append
+        find = text.find
+        plen = len(pattern)
+        i = find(pattern)
+        while i != -1:
+            append((i, i + plen))
+            i = find(pattern, i + 1)
         return spans
 
     def search_for(self: Sonnet, query: str) -> SearchResult:
@@ -98,113 +149,113 @@ class Sonnet:
         lines_raw = self.lines
 
         q = query.lower()
-        title_spans = self.find_spans(title_raw.lower(), q)
+        title_spans = self.find_spans(self._title_lower, q)
 
         line_matches = []
         for idx, line_raw in enumerate(lines_raw, start=1):
-            spans = self.find_spans(line_raw.lower(), q)
+            spans = self.find_spans(self._lines_lower[idx - 1], q)
             if spans:
                 line_matches.append(LineMatch(idx, line_raw, spans))
 
         total = len(title_spans) + sum(len(lm.spans) for lm in line_matches)
 
-        return SearchResult(title_raw, title_spans, line_matches, total)
+        return SearchResult(self.id, title_raw, title_spans, line_matches, total)
 
 
 class LineMatch:
+    # invariant: spans are kept in ascending start order. find_spans and
+    # Index.search_for emit them that way and combine_with preserves the
+    # order via heapq.merge, so rendering never has to re-sort.
+    __slots__ = ('line_no', 'text', 'spans')
+
     def __init__(self, line_no: int, text: str, spans: List[Tuple[int, int]]):
         self.line_no = line_no
         self.text = text
         self.spans = spans
 
-    def copy(self):
-        return LineMatch(self.line_no, self.text, list(self.spans))
-
-
-class Posting:
-    def __init__(self, line_no: int, position: int, token_length: int):
-        self.line_no = line_no
-        self.position = position
-        # NEW: store original token length for correct highlighting
-        self.token_length = token_length
-
-    def __repr__(self) -> str:
-        return f"{self.line_no}:{self.position}"
 
+# A posting is a plain (line_no, position, token_length) tuple - much
+# smaller than a dedicated object and cheaper to iterate over.
+# line_no is None for title matches; token_length is the original
+# (unstemmed) length so highlighting covers the full word.
 
 class Index:
     def __init__(self, sonnets: list[Sonnet]):
         self.sonnets = {sonnet.id: sonnet for sonnet in sonnets}
-        self.dictionary = {}
+        # token -> doc_id -> list of postings; defaultdict saves the
+        # "not in" check plus second lookup on every token added
+        self.dictionary = defaultdict(lambda: defaultdict(list))
+        # token -> set of doc_ids, for cheap AND-mode intersection
+        self.doc_sets = defaultdict(set)
 
         for sonnet in sonnets:
-            # index the title - line_no is None for title
-            title_tokens = self.tokenize(sonnet.title)
-            for token, position in title_tokens:
-                # NEW: stem the token but keep original length
-                stemmed = stem(token)
-                self._add_token(sonnet.id, stemmed, None, position, len(token))
-
-            # index each line - line_no starts from 1
+            # collect every token of the sonnet first so we can stem them
+            # in one batch instead of one call per token
+            entries = []  # (line_no, token, position) - line_no is None for title
+            for token, position in self.tokenize(sonnet.title):
+                entries.append((None, token, position))
             for line_no, line in enumerate(sonnet.lines, start=1):
-                line_tokens = self.tokenize(line)
-                for token, position in line_tokens:
-                    # NEW: stem the token but keep original length
-                    stemmed = stem(token)
-                    self._add_token(sonnet.id, stemmed, line_no, position, len(token))
+                for token, position in self.tokenize(line):
+                    entries.append((line_no, token, position))
+
+            # stem each unique word of the sonnet once, then write the
+            # postings through the mapping - repeated words are free
+            unique_tokens = list({token for _, token, _ in entries})
+            stem_map = dict(zip(unique_tokens, stem_all(unique_tokens)))
+            for line_no, token, position in entries:
+                self._add_token(sonnet.id, stem_map[token], line_no, position, len(token))
 
     @staticmethod
     def tokenize(text):
         """Split text into tokens with their positions"""
-        import re
-        tokens = [
+        return [
             (match.group(), match.start())
-            for match in re.finditer(r"\S+", text)
+            for match in _TOKEN_RE.finditer(text)
         ]
-        return tokens
 
     def _add_token(self, doc_id: int, token: str, line_no: int | None, position: int, token_length: int):
         """Add token to the inverted index"""
-        if token not in self.dictionary:
-            self.dictionary[token] = {}
-
-        postings_list = self.dictionary[token]
-
-        if doc_id not in postings_list:
-            postings_list[doc_id] = []
-        postings_list[doc_id].append(Posting(line_no, position, token_length))
-
-    def search_for(self, token: str) -> dict[int, SearchResult]:
-        """Search for a token in the index"""
+        # interned keys share one string object, so dict lookups can
+        # short-circuit on identity instead of hashing the whole key
+        token = sys.intern(token)
+        self.dictionary[token][doc_id].append((line_no, position, token_length))
+        self.doc_sets[token].add(doc_id)
+
+    def search_for(self, token: str, only: set[int] | None = None) -> dict[int, SearchResult]:
+        """Search for a token in the index, optionally restricted to the
+        doc ids in `only`"""
         results = {}
 
         # NEW: stem the search token too!
-        stemmed_token = stem(token)
+        stemmed_token = sys.intern(stem(token))
 
         if stemmed_token in self.dictionary:
             postings_list = self.dictionary[stemmed_token]
             for doc_id, postings in postings_list.items():
-                for posting in postings:
-                    sonnet = self.sonnets[doc_id]
-
-                    if posting.line_no is None:
-                        # match in title - use original token length for span
-                        title_spans = [(posting.position, posting.position + posting.token_length)]
-                        line_matches = []
+                if only is not None and doc_id not in only:
+                    continue
+                sonnet = self.sonnets[doc_id]
+
+                # aggregate every span of this sonnet directly, instead of
+                # building one SearchResult per posting and merging them
+                title_spans = []
+                line_spans = defaultdict(list)  # line_no -> spans
+                for line_no, position, token_length in postings:
+                    # use original token length for span
+                    span = (position, position + token_length)
+                    if line_no is None:
+                        # match in title
+                        title_spans.append(span)
                     else:
-                        # match in line
-                        title_spans = []
-                        line_text = sonnet.lines[posting.line_no - 1]
-                        # use original token length for span
-                        span = (posting.position, posting.position + posting.token_length)
-                        line_matches = [LineMatch(posting.line_no, line_text, [span])]
+                        line_spans[line_no].append(span)
 
-                    result = SearchResult(sonnet.title, title_spans, line_matches, 1)
+                # one LineMatch per line, built after all spans are known
+                line_matches = [
+                    LineMatch(line_no, sonnet.lines[line_no - 1], spans)
+                    for line_no, spans in line_spans.items()
+                ]
 
-                    if doc_id not in results:
-                        results[doc_id] = result
-                    else:
-                        results[doc_id] = results[doc_id].combine_with(result)
+                results[doc_id] = SearchResult(doc_id, sonnet.title, title_spans, line_matches, len(postings))
 
         return results
 
@@ -217,11 +268,22 @@ class Searcher:
         """Search for multi-word query"""
         words = query.split()
 
+        surviving = None
+        if search_mode == "AND" and len(words) > 1:
+            # intersect the per-token doc-id sets first, so full results
+            # are only built for sonnets that contain every word
+            doc_sets = [self.index.doc_sets.get(stem(word)) for word in words]
+            if not all(doc_sets):
+                return []
+            surviving = set.intersection(*doc_sets)
+            if not surviving:
+                return []
+
         combined_results = {}
 
         for word in words:
             # search_for will stem the word internally
-            results = self.index.search_for(word)
+            results = self.index.search_for(word, surviving)
 
             if not combined_results:
                 # first word
@@ -243,27 +305,31 @@ class Searcher:
                             combined_results[doc_id] = result
 
         results = list(combined_results.values())
-        return sorted(results, key=lambda sr: sr.title)
+        # sort by sonnet id - integer compares are cheap and, unlike the
+        # title string, don't put "Sonnet 10" before "Sonnet 2"
+        return sorted(results, key=lambda sr: sr.id)
 
 
 class SearchResult:
-    def __init__(self, title: str, title_spans: List[Tuple[int, int]], line_matches: List[LineMatch],
+    # title_spans follow the same ascending-start invariant as
+    # LineMatch.spans
+    __slots__ = ('id', 'title', 'title_spans', 'line_matches', 'matches')
+
+    def __init__(self, id: int, title: str, title_spans: List[Tuple[int, int]], line_matches: List[LineMatch],
                  matches: int) -> None:
+        self.id = id
         self.title = title
         self.title_spans = title_spans
         self.line_matches = line_matches
         self.matches = matches
 
-    def copy(self):
-        return SearchResult(self.title, list(self.title_spans), [lm.copy() for lm in self.line_matches], self.matches)
-
     @staticmethod
     def ansi_highlight(text: str, spans, highlight_mode) -> str:
         """Return text with ANSI highlight escape codes"""
         if not spans:
             return text
 
-        spans = sorted(spans)
+        # spans arrive sorted by start (see LineMatch) - no re-sort needed
         merged = []
 
         # merge overlapping spans
@@ -278,15 +344,19 @@ class SearchResult:
 
         ansi_sequence = "\033[43m\033[30m" if highlight_mode == "DEFAULT" else "\033[1;92m"
 
-        out = []
+        # pre-size the pieces list (4 per merged span + trailing text) so
+        # it isn't grown append by append in the print loop
+        out = [""] * (4 * len(merged) + 1)
         i = 0
+        j = 0
         for s, e in merged:
-            out.append(text[i:s])
-            out.append(ansi_sequence)
-            out.append(text[s:e])
-            out.append("\033[0m")
+            out[j] = text[i:s]
+            out[j + 1] = ansi_sequence
+            out[j + 2] = text[s:e]
+            out[j + 3] = "\033[0m"
+            j += 4
             i = e
-        out.append(text[i:])
+        out[j] = text[i:]
         return "".join(out)
 
     def print(self, idx, highlight_mode: str | None, total_docs):
@@ -305,21 +375,32 @@ class SearchResult:
             print(f"  [{lm.line_no:2}] {line_out}")
 
     def combine_with(self: SearchResult, other: SearchResult) -> SearchResult:
-        """Combine two search results"""
-
-        combined = self.copy()
-
-        combined.matches = self.matches + other.matches
-        combined.title_spans = sorted(self.title_spans + other.title_spans)
-
-        lines_by_no = {lm.line_no: lm.copy() for lm in self.line_matches}
-        for lm in other.line_matches:
-            ln = lm.line_no
-            if ln in lines_by_no:
-                lines_by_no[ln].spans = lines_by_no[ln].spans + lm.spans
+        """Combine two search results into a new one.
+
+        Neither input is mutated, so line matches and span lists are
+        shared by reference when only one side contributes them; new
+        lists are only allocated where both sides hit the same line.
+        Spans stay in ascending order via linear heapq.merge - no
+        re-sort on every combine.
+        """
+        if not other.title_spans:
+            title_spans = self.title_spans
+        elif not self.title_spans:
+            title_spans = other.title_spans
+        else:
+            title_spans = list(heapq.merge(self.title_spans, other.title_spans))
+
+        other_by_no = {lm.line_no: lm for lm in other.line_matches}
+        line_matches = []
+        for lm in self.line_matches:
+            other_lm = other_by_no.pop(lm.line_no, None)
+            if other_lm is None:
+                line_matches.append(lm)
             else:
-                lines_by_no[ln] = lm.copy()
-
-        combined.line_matches = sorted(lines_by_no.values(), key=lambda x: x.line_no)
+                merged_spans = list(heapq.merge(lm.spans, other_lm.spans))
+                line_matches.append(LineMatch(lm.line_no, lm.text, merged_spans))
+        line_matches.extend(other_by_no.values())
+        line_matches.sort(key=lambda x: x.line_no)
 
-        return combined
\ No newline at end of file
+        return SearchResult(self.id, self.title, title_spans, line_matches,
+                            self.matches + other.matches)
\ No newline at end of file